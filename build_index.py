@@ -1,16 +1,20 @@
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from multiprocessing import Pool
 
 from lib.common import read_doc_mapping, write_doc_mapping, write_pagerank
 from lib.doc_loading import iter_documents
-from lib.duplicate_detector import DuplicateDetector
-from lib.globals import BATCH_SIZE, DATASET_DIR, FINAL_INDEX_DIR, PARTIAL_INDEX_DIR
+from lib.duplicate_detector import DuplicateDetector, compute_simhash, content_hash
+from lib.globals import BATCH_SIZE, DATASET_DIR, FINAL_INDEX_DIR, NUM_BITS, PARTIAL_INDEX_DIR
 from lib.index import (
     Index,
     merge_partial_indexes,
+    merge_partials,
 )
 from lib.links import extract_outlinks, normalize_url
-from lib.parse_text import assign_importance, extract_text, tokenize
+from lib.parse_text import extract_tokens
 from lib.pagerank import compute_pagerank
 
 
@@ -19,19 +23,17 @@ def _get_file_size_kb(path: str) -> float:
 
 
 def _print_progress(file_count, doc_count, exact_dups, near_dups, unique_tokens):
-    if file_count % 1000 == 0:
-        print(
-            f"\tProcessed {file_count} total files, indexed {doc_count} documents "
-            f"({exact_dups} exact, {near_dups} near duplicates skipped, {unique_tokens} unique tokens in current index)"
-        )
+    print(
+        f"\tProcessed {file_count} total files, indexed {doc_count} documents "
+        f"({exact_dups} exact, {near_dups} near duplicates skipped, {unique_tokens} unique tokens in current index)"
+    )
 
 
-def _offload_partial_index(index: Index, directory: str, paths: list[str], doc_id: int):
-    part_path = os.path.join(directory, f"partial_{len(paths)}.jsonl")
-    total_postings = sum(len(entry.doc_postings) for entry in index.token_to_entry.values())
-    print(f"      Writing partial index #{len(paths)}:")
+def _offload_partial_index(index: Index, directory: str, part_num: int, doc_id: int) -> str:
+    part_path = os.path.join(directory, f"partial_{part_num}.bin")
+    print(f"      Writing partial index #{part_num}:")
     print(f"         - {len(index)} unique tokens")
-    print(f"         - {total_postings} total postings")
+    print(f"         - {index.total_postings} total postings")
     print(f"         - {doc_id} documents indexed so far")
     print(f"         - Saving to: {part_path}")
 
@@ -39,7 +41,43 @@ def _offload_partial_index(index: Index, directory: str, paths: list[str], doc_i
 
     file_size_kb = _get_file_size_kb(part_path)
     print(f"         - Partial index size: {file_size_kb:.2f} KB\n")
-    paths.append(part_path)
+    return part_path
+
+
+def _cascade_partial(part_path: str, levels: list[str | None], directory: str, merge_seq) -> None:
+    # logarithmic merging: partials are bucketed by level and two same-level
+    # partials merge immediately into one at the next level, so only O(log n)
+    # partials exist at any time and the final k-way merge stays narrow
+    level = 0
+    while level < len(levels) and levels[level] is not None:
+        other = levels[level]
+        levels[level] = None
+        merged_path = os.path.join(directory, f"partial_merged_{next(merge_seq)}.bin")
+        print(f"      Merging level-{level} partials -> {merged_path}")
+        merge_partials([other, part_path], merged_path)
+        os.remove(other)
+        os.remove(part_path)
+        part_path = merged_path
+        level += 1
+    if level == len(levels):
+        levels.append(None)
+    levels[level] = part_path
+
+
+def _flush_partial(index: Index, directory: str, part_num: int, doc_id: int, levels: list[str | None], merge_seq) -> None:
+    # runs on the single writer thread: serialize the partial and cascade merges
+    # while the main loop keeps consuming parsed documents
+    part_path = _offload_partial_index(index, directory, part_num, doc_id)
+    _cascade_partial(part_path, levels, directory, merge_seq)
+
+
+# per-document CPU work (HTML parse, tokenize, simhash) done in pool workers;
+# dedup bookkeeping and index assembly stay on the main process for determinism
+def _parse_document(doc: tuple[str, str, bytes]):
+    url, html, content_digest = doc
+    token_importance = extract_tokens(html)
+    token_counts = {token: len(positions) for token, positions in token_importance.items()}
+    return url, content_digest, compute_simhash(token_counts, NUM_BITS), token_importance
 
 
 # build inverted index, returns (num_docs, num_unique_tokens, index_size_kb, exact_dups_removed, near_dups_removed)
@@ -59,7 +97,11 @@ def build_index(
     print(f"\tBatch size: {BATCH_SIZE} documents per partial index\n")
 
     doc_id_to_url: dict[int, str] = {}
-    partial_paths: list[str] = []
+    levels: list[str | None] = []  # level -> pending partial path (logarithmic merging)
+    part_count = 0
+    merge_seq = count()
+    flush_futures = []
+    writer = ThreadPoolExecutor(max_workers=1)  # single writer: flushes never overlap each other
     current_index = Index()
     next_doc_id = 0
     file_count = 0
@@ -67,51 +109,76 @@ def build_index(
     near_dups_removed = 0
     detector = DuplicateDetector()
 
+    prefiltered_exact = [0]  # mutated from the pool's task feeder thread
+
+    def _iter_new_documents():
+        # runs on the pool's feeder thread: hash before parsing so documents
+        # whose digest is already registered never pay extract/tokenize cost.
+        # In-flight documents aren't registered yet, so the authoritative
+        # detector.check below still runs on every result.
+        for url, html in iter_documents(dataset_dir):
+            if html is None:
+                continue
+            content_digest = content_hash(html)
+            if detector.check(content_digest, None) == "exact":
+                prefiltered_exact[0] += 1
+                continue
+            yield url, html, content_digest
+
     print("[2/5] Processing documents and building index...")
-    for url, html in iter_documents(dataset_dir):
-        if html is None:
-            continue
-
-        file_count += 1
-        # progress printing (runs for every 1000 files)
-        _print_progress(
-            file_count,
-            next_doc_id,
-            exact_dups_removed,
-            near_dups_removed,
-            len(current_index),
-        )
-        # partial index offload (runs for every file, keyed on file_count)
-        if file_count % BATCH_SIZE == 0 and current_index:
-            _offload_partial_index(current_index, partial_dir, partial_paths, next_doc_id)
-            current_index = Index()
-        # text extraction and tokenization
-        full_text, spans = extract_text(html)
-        starts = tokenize(full_text)
-        token_importance = assign_importance(starts, spans)
-        # duplicate detection
-        skip_reason, simhash_val = detector.check(html, {token: len(starts) for token, starts in starts.items()})
-        if skip_reason == "exact":
-            exact_dups_removed += 1
-            continue
-        if skip_reason == "near":
-            near_dups_removed += 1
-            continue
-
-        detector.register_content_hash(html)
-        doc_id = next_doc_id
-        next_doc_id += 1
-        if simhash_val is not None:
-            detector.add_doc(simhash_val, doc_id)
-
-        doc_id_to_url[doc_id] = url
-        for token in token_importance:
-            for start, importance in token_importance[token]:
-                current_index.add_token(token, doc_id, start, importance)
+    with Pool(processes=os.cpu_count()) as pool:
+        for result in pool.imap(_parse_document, _iter_new_documents(), chunksize=32):
+            file_count += 1
+            # progress printing, gated here so non-reporting files don't pay the call
+            if file_count % 1000 == 0:
+                _print_progress(
+                    file_count,
+                    next_doc_id,
+                    exact_dups_removed + prefiltered_exact[0],
+                    near_dups_removed,
+                    len(current_index),
+                )
+            # partial index offload (runs for every file, keyed on file_count)
+            if file_count % BATCH_SIZE == 0 and current_index:
+                flush_futures.append(
+                    writer.submit(_flush_partial, current_index, partial_dir, part_count, next_doc_id, levels, merge_seq)
+                )
+                part_count += 1
+                current_index = Index()
+
+            url, content_digest, simhash_val, token_importance = result
+            # duplicate detection
+            skip_reason = detector.check(content_digest, simhash_val)
+            if skip_reason == "exact":
+                exact_dups_removed += 1
+                continue
+            if skip_reason == "near":
+                near_dups_removed += 1
+                continue
+
+            detector.register_content_hash(content_digest)
+            doc_id = next_doc_id
+            next_doc_id += 1
+            if simhash_val is not None:
+                detector.add_doc(simhash_val, doc_id)
+
+            doc_id_to_url[doc_id] = url
+            add_token = current_index.add_token  # hoisted: this loop runs once per posting
+            for token, positions in token_importance.items():
+                for start, importance in positions:
+                    add_token(token, doc_id, start, importance)
+
+    exact_dups_removed += prefiltered_exact[0]
 
     # write remaining in-memory index as last partial if non-empty
     if current_index:
-        _offload_partial_index(current_index, partial_dir, partial_paths, next_doc_id)
+        flush_futures.append(
+            writer.submit(_flush_partial, current_index, partial_dir, part_count, next_doc_id, levels, merge_seq)
+        )
+    for future in flush_futures:
+        future.result()  # surface any writer-thread errors before merging
+    writer.shutdown()
+    partial_paths = [path for path in levels if path is not None]
 
     # persist doc_id -> URL mapping for report and future search
     print(f"[3/5] Writing document mapping ({len(doc_id_to_url)} documents)...")
@@ -149,7 +216,9 @@ def main(arg) -> None:
     if arg:
         build_index()
     else:
-        partial_paths = [os.path.join(PARTIAL_INDEX_DIR, f"partial_{num}.jsonl") for num in range(12)]
+        partial_paths = sorted(
+            os.path.join(PARTIAL_INDEX_DIR, name) for name in os.listdir(PARTIAL_INDEX_DIR) if name.endswith(".bin")
+        )
         merge_partial_indexes(partial_paths, len(read_doc_mapping()))
 
 
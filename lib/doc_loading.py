@@ -1,25 +1,32 @@
-import json
+import mmap
 import os
 from urllib.parse import urldefrag
 
+import numpy as np
+import orjson
+
+
+def packed_corpus_paths(dataset_dir: str) -> tuple[str, str]:
+    """Paths of the packed corpus blob and its offset table for a dataset folder"""
+    base = dataset_dir.rstrip(os.sep)
+    return base + ".bin", base + ".idx"
+
 
 def all_jsons_iter(dataset_dir):
-    """Finds every json in the dataset folder"""
-    all_paths = []
-    for dirpath, _, filenames in os.walk(dataset_dir):
-        all_paths.extend([os.path.join(dirpath, name) for name in filenames if name.endswith(".json")])
-    all_paths.sort()
-    yield from all_paths
+    """Finds every json in the dataset folder, yielding during the walk.
 
+    scandir caches stat info (no re-stat per entry) and sorting per directory
+    keeps the order deterministic without materializing every path first."""
+    with os.scandir(dataset_dir) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from all_jsons_iter(entry.path)
+        elif entry.name.endswith(".json"):
+            yield entry.path
 
-def read_json_file(json_file):
-    """Returns url and html from a single json file"""
-    with open(json_file, "r", encoding="utf-8", errors="ignore") as file:
-        try:
-            data = json.load(file)
-        except json.JSONDecodeError:
-            return (None, None)
 
+def _extract_url_html(data):
     url = data.get("url")
     html = data.get("content")
     if not url:
@@ -28,7 +35,38 @@ def read_json_file(json_file):
     return (url, html)
 
 
+def read_json_file(json_file):
+    """Returns url and html from a single json file"""
+    with open(json_file, "rb") as file:
+        try:
+            data = orjson.loads(file.read())
+        except orjson.JSONDecodeError:
+            return (None, None)
+    return _extract_url_html(data)
+
+
+def iter_packed_documents(bin_path, idx_path):
+    """Yields (url, html) from a packed corpus: one mmap'd blob plus an offset table
+    instead of an open/read/parse per tiny file"""
+    offsets = np.fromfile(idx_path, dtype=np.uint64)
+    with open(bin_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+            try:
+                data = orjson.loads(mm[start:end])
+            except orjson.JSONDecodeError:
+                continue
+            url, html = _extract_url_html(data)
+            if url is None:
+                continue
+            yield url, html
+
+
 def iter_documents(dataset_dir):
+    # prefer the packed corpus (built by pack_corpus.py) when it exists
+    bin_path, idx_path = packed_corpus_paths(dataset_dir)
+    if os.path.exists(bin_path) and os.path.exists(idx_path):
+        yield from iter_packed_documents(bin_path, idx_path)
+        return
     for path in all_jsons_iter(dataset_dir):
         url, html = read_json_file(path)
         if url is None:
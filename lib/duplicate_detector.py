@@ -1,93 +1,114 @@
-import hashlib
+from functools import lru_cache
+
+import numpy as np
+import xxhash
 
 from lib.globals import HAMMING_K, NUM_BITS
 
 _hash_cache = {}  # cache for content hashes to avoid redundant hashing
 
 def compute_simhash(token_counts: dict[str, int], num_bits: int = 64) -> int:
-    bit_sums = [0] * num_bits
-    for term, weight in token_counts.items():
-        if weight <= 0:
-            continue
+    terms = [term for term, weight in token_counts.items() if weight > 0]
+    if not terms:
+        return 0
+    for term in terms:
         if term not in _hash_cache:
-            _hash_cache[term] = int.from_bytes(
-                hashlib.sha256(term.encode("utf-8", errors="ignore")).digest()[:8],
-                byteorder="big",
-            )
-        hashed = _hash_cache[term]
-        for i in range(num_bits):
-            if (hashed >> i) & 1:
-                bit_sums[i] += weight
-            else:
-                bit_sums[i] -= weight
-    fingerprint = 0
-    for i in range(num_bits):
-        if bit_sums[i] > 0:
-            fingerprint |= 1 << i
-    return fingerprint
+            # xxh3 is not cryptographic, but SimHash only needs a uniform 64-bit hash
+            _hash_cache[term] = xxhash.xxh3_64_intdigest(term.encode("utf-8", errors="ignore"))
+    # unpack all term hashes into an (N, num_bits) bit matrix and reduce the weighted
+    # +1/-1 column sums in one matrix product instead of num_bits ops per term
+    hashes = np.fromiter((_hash_cache[term] for term in terms), dtype=np.uint64, count=len(terms))
+    weights = np.fromiter((token_counts[term] for term in terms), dtype=np.int64, count=len(terms))
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")[:, :num_bits]
+    bit_sums = (2 * bits.astype(np.int64) - 1).T @ weights
+    return int.from_bytes(np.packbits(bit_sums > 0, bitorder="little").tobytes(), byteorder="little")
 
 
 def hamming_distance(a: int, b: int) -> int:
     return (a ^ b).bit_count()
 
 
+@lru_cache(maxsize=None)
+def _block_shifts(num_bits: int, num_blocks: int) -> tuple[tuple[int, ...], int]:
+    block_size = num_bits // num_blocks
+    return tuple(i * block_size for i in range(num_blocks)), (1 << block_size) - 1
+
+
 def block_values(
     fingerprint: int, num_bits: int = 64, num_blocks: int = 4
-) -> list[int]:
-    block_size = num_bits // num_blocks
-    blocks = []
-    for i in range(num_blocks):
-        start_bit = i * block_size
-        block = (fingerprint >> start_bit) & ((1 << block_size) - 1)
-        blocks.append(block)
-    return blocks
+) -> tuple[int, ...]:
+    # shifts and mask depend only on the (fixed) block geometry, so they're cached
+    shifts, mask = _block_shifts(num_bits, num_blocks)
+    return tuple((fingerprint >> shift) & mask for shift in shifts)
+
 
+def content_hash(content: str) -> bytes:
+    # xxh3 runs at GB/s and 128 bits is plenty for an equality-only dedup check;
+    # raw 16-byte digests keep the seen-set small
+    return xxhash.xxh3_128_digest(content.encode("utf-8", errors="ignore"))
 
-def content_hash(content: str) -> str:
-    return hashlib.sha256(content.encode("utf-8", errors="ignore")).hexdigest()
+
+class _BlockBucket:
+    # parallel simhash/doc_id columns for one block value, grown geometrically;
+    # contiguous uint64 storage instead of a Python list of (int, int) tuples
+    __slots__ = ("_sims", "_doc_ids", "_size")
+
+    def __init__(self):
+        self._sims = np.empty(8, dtype=np.uint64)
+        self._doc_ids = np.empty(8, dtype=np.uint32)
+        self._size = 0
+
+    def append(self, simhash: int, doc_id: int) -> None:
+        if self._size == len(self._sims):
+            self._sims = np.resize(self._sims, self._size * 2)
+            self._doc_ids = np.resize(self._doc_ids, self._size * 2)
+        self._sims[self._size] = simhash
+        self._doc_ids[self._size] = doc_id
+        self._size += 1
+
+    @property
+    def sims(self) -> np.ndarray:
+        return self._sims[: self._size]
 
 
 class DuplicateDetector:
     def __init__(self, hamming_k: int = HAMMING_K):
-        self._seen_content_hashes: set[str] = set()
+        self._seen_content_hashes: set[bytes] = set()
         self._hamming_k = hamming_k
         self._num_blocks = hamming_k + 1
-        self._block_indexes: list[dict[int, list[tuple[int, int]]]] = [
+        self._block_indexes: list[dict[int, _BlockBucket]] = [
             {} for _ in range(self._num_blocks)
         ]
-
-    def check(
-        self, content: str | None, token_counts: dict[str, int] | None
-    ) -> tuple[str | None, int | None]:
-        # Sanity checks
-        if content is None:
-            return None, None
-        if token_counts is None:
-            return None, None
+    def check(self, content_digest: bytes | None, simhash: int | None) -> str | None:
+        # digests and simhashes are computed by the caller (parse workers), so the
+        # detector only consults its in-memory state here
+        if content_digest is None:
+            return None
         # Check for exact duplicate using content hash
-        ch = content_hash(content)
-        if ch in self._seen_content_hashes:
-            return "exact", None
+        if content_digest in self._seen_content_hashes:
+            return "exact"
         # Check for near duplicate using SimHash
-        simhash = compute_simhash(token_counts, NUM_BITS)
+        if simhash is None:
+            return None
         blocks = block_values(simhash, NUM_BITS, self._num_blocks)
         for i, block_val in enumerate(blocks):
-            candidates = self._block_indexes[i].get(block_val, [])
-            for other_simhash, _ in candidates:
-                if (
-                    hamming_distance(simhash, other_simhash)
-                    <= self._hamming_k
-                ):
-                    return "near", None
-        return None, simhash
+            bucket = self._block_indexes[i].get(block_val)
+            if bucket is None:
+                continue
+            # one vectorized XOR + popcount over the whole bucket
+            distances = np.bitwise_count(bucket.sims ^ np.uint64(simhash))
+            if (distances <= self._hamming_k).any():
+                return "near"
+        return None
 
     def add_doc(self, simhash: int, doc_id: int) -> None:
         blocks = block_values(simhash, NUM_BITS, self._num_blocks)
         for i, block_val in enumerate(blocks):
-            if block_val not in self._block_indexes[i]:
-                self._block_indexes[i][block_val] = []
-            self._block_indexes[i][block_val].append((simhash, doc_id))
+            bucket = self._block_indexes[i].get(block_val)
+            if bucket is None:
+                bucket = self._block_indexes[i][block_val] = _BlockBucket()
+            bucket.append(simhash, doc_id)
 
-    def register_content_hash(self, content: str) -> None:
-        if content is not None:
-            self._seen_content_hashes.add(content_hash(content))
+    def register_content_hash(self, content_digest: bytes) -> None:
+        if content_digest is not None:
+            self._seen_content_hashes.add(content_digest)
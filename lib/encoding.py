@@ -0,0 +1,26 @@
+# Unsigned LEB128 varints, used by the binary index format. Small deltas
+# (doc_id gaps, position gaps) encode to a single byte instead of ASCII digits.
+
+
+def encode_varint(value: int, out: bytearray) -> None:
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def decode_varint(buf, pos: int) -> tuple[int, int]:
+    # returns (value, next position); buf is anything byte-indexable (bytes, mmap)
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
@@ -10,13 +10,18 @@ PARTIAL_INDEX_DIR = os.path.join("index", "partials")
 FINAL_INDEX_DIR = os.path.join("index", "final")
 # File paths
 TOKEN_INFO_PATH = os.path.join(FINAL_INDEX_DIR, "offsets.json")
-FINAL_INDEX_PATH = os.path.join(FINAL_INDEX_DIR, "final_index.jsonl")
+FINAL_INDEX_PATH = os.path.join(FINAL_INDEX_DIR, "final_index.bin")
 DOC_MAPPING_PATH = os.path.join(FINAL_INDEX_DIR, "doc_mapping.json")
 DOC_NORM_PATH = os.path.join(FINAL_INDEX_DIR, "doc_norms.jsonl")
+DOC_LENGTH_PATH = os.path.join(FINAL_INDEX_DIR, "doc_lengths.json")
 DOC_PAGERANK_PATH = os.path.join(FINAL_INDEX_DIR, "doc_pagerank.json")
 IDF_PATH = os.path.join(FINAL_INDEX_DIR, "idf.json")
 # Other constants
 BATCH_SIZE = 10000
+ENTRY_CACHE_SIZE = 100_000
 RETURN_SIZE = 100
 MIN_IDF = 0.3
 PROXIMITY_WEIGHT = 0.5
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
@@ -1,15 +1,21 @@
 import bisect
 import heapq
-import json
 import math
+import mmap
 import os
+import struct
 from collections import defaultdict
-from contextlib import ExitStack
 from dataclasses import dataclass, field
 from enum import IntEnum
-from typing import TextIO
 
-from lib.globals import DOC_NORM_PATH, FINAL_INDEX_PATH, TOKEN_INFO_PATH
+import numpy as np
+import orjson
+
+from lib.encoding import decode_varint, encode_varint
+from lib.globals import DOC_LENGTH_PATH, DOC_NORM_PATH, FINAL_INDEX_PATH, TOKEN_INFO_PATH
+
+
+LOG_TF_SCALE = 32  # log_tf stored as u8 fixed point: supports log_tf up to ~8 (tf ~ 10^7) at ~0.03 resolution
 
 
 class Importance(IntEnum):
@@ -19,7 +25,7 @@ class Importance(IntEnum):
     TITLE = 2
 
 
-@dataclass
+@dataclass(slots=True)
 class DocPosting:
     doc_id: int
     positions: list[tuple[int, Importance]]  # (start, importance) pairs
@@ -47,20 +53,26 @@ class DocPosting:
         }
 
     def add_position(self, start: int, importance: Importance) -> None:
-        index = bisect.bisect_left(self.positions, (start, importance))
-        self.positions.insert(index, (start, importance))
+        # during build positions arrive in increasing start order, so this is
+        # almost always a plain append; keep bisect only for the out-of-order case
+        if not self.positions or self.positions[-1] <= (start, importance):
+            self.positions.append((start, importance))
+        else:
+            index = bisect.bisect_left(self.positions, (start, importance))
+            self.positions.insert(index, (start, importance))
 
     def add_positions(self, other: "DocPosting") -> None:
-        for pos in other.positions:
-            self.add_position(*pos)
+        # both position lists are kept sorted, so a linear merge beats repeated bisect inserts
+        self.positions = list(heapq.merge(self.positions, other.positions))
 
 
-@dataclass
+@dataclass(slots=True)
 class IndexEntry:
     # inverted index entry: one token -> list of postings (sorted by doc_id)
     token: str
     doc_postings: dict[int, DocPosting] = field(default_factory=dict)  # doc_id -> DocPosting for quick lookup
     idf: float = 0
+    _score_arrays: tuple = field(default=None, repr=False, compare=False)  # cached (doc_ids, log_tfs) for scoring
 
     @classmethod
     def from_dict(cls, d: dict, with_token: bool = True, query_mode=False) -> "IndexEntry":
@@ -77,22 +89,94 @@ class IndexEntry:
             "idf": round(self.idf, 4),
         }
 
+    def to_bytes(self) -> bytes:
+        # binary final-index record (token lives in the offset table, not the record):
+        # idf:f32 | n_postings:varint | per posting:
+        #   doc_id delta:varint | log_tf:u8 fixed point | positions_nbytes:varint | (start delta:varint, importance:u8)*
+        out = bytearray(struct.pack("<f", self.idf))
+        encode_varint(len(self.doc_postings), out)
+        prev_doc_id = 0
+        for doc_id in sorted(self.doc_postings):
+            posting = self.doc_postings[doc_id]
+            encode_varint(doc_id - prev_doc_id, out)
+            prev_doc_id = doc_id
+            out.append(min(255, max(0, round(posting.log_tf * LOG_TF_SCALE))))
+            positions_blob = bytearray()
+            prev_start = 0
+            for start, importance in posting.positions:
+                encode_varint(start - prev_start, positions_blob)
+                positions_blob.append(int(importance))
+                prev_start = start
+            encode_varint(len(positions_blob), out)
+            out += positions_blob
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, buf, offset: int = 0, token: str = "", query_mode=False) -> "IndexEntry":
+        return cls.decode(buf, offset, token=token, query_mode=query_mode)[0]
+
+    @classmethod
+    def decode(cls, buf, offset: int = 0, token: str = "", query_mode=False) -> tuple["IndexEntry", int]:
+        # like from_bytes, but also returns the end offset for sequential readers
+        idf = struct.unpack_from("<f", buf, offset)[0]
+        pos = offset + 4
+        num_postings, pos = decode_varint(buf, pos)
+        entry = cls(token=token, idf=idf)
+        doc_id = 0
+        for _ in range(num_postings):
+            delta, pos = decode_varint(buf, pos)
+            doc_id += delta
+            log_tf = buf[pos] / LOG_TF_SCALE
+            pos += 1
+            blob_len, pos = decode_varint(buf, pos)
+            positions: list[tuple[int, Importance]] = []
+            if query_mode:
+                pos += blob_len  # scoring doesn't need positions; skip the whole blob
+            else:
+                blob_end = pos + blob_len
+                start = 0
+                while pos < blob_end:
+                    start_delta, pos = decode_varint(buf, pos)
+                    start += start_delta
+                    positions.append((start, Importance(buf[pos])))
+                    pos += 1
+            entry.doc_postings[doc_id] = DocPosting(doc_id=doc_id, positions=positions, log_tf=log_tf)
+        return entry, pos
+
     def get_posting(self, doc_id: int) -> DocPosting | None:
         return self.doc_postings.get(doc_id)
 
-    def add_posting(self, doc_id: int, start: int, importance: Importance) -> None:
+    def score_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # sorted doc_id / log_tf / raw tf columns for vectorized scoring, built once per entry
+        if self._score_arrays is None:
+            n = len(self.doc_postings)
+            doc_ids = np.fromiter(self.doc_postings.keys(), dtype=np.int64, count=n)
+            log_tfs = np.fromiter((p.log_tf for p in self.doc_postings.values()), dtype=np.float64, count=n)
+            order = np.argsort(doc_ids)
+            log_tfs = log_tfs[order]
+            tfs = np.where(log_tfs > 0, 10.0 ** (log_tfs - 1), 0.0)  # invert log_tf = 1 + log10(tf)
+            self._score_arrays = (doc_ids[order], log_tfs, tfs)
+        return self._score_arrays
+
+    def add_posting(self, doc_id: int, start: int, importance: Importance) -> bool:
+        # returns True when a new (token, doc) posting was created
         existing_posting = self.get_posting(doc_id)
         if existing_posting:
             existing_posting.add_position(start, importance)
-        else:
-            new_posting = DocPosting(doc_id=doc_id, positions=[(start, importance)])
-            self.doc_postings[doc_id] = new_posting
+            return False
+        new_posting = DocPosting(doc_id=doc_id, positions=[(start, importance)])
+        self.doc_postings[doc_id] = new_posting
+        return True
 
     def merge(self, other: "IndexEntry") -> None:
-        # merge postings from another IndexEntry
-        for doc_id, postings in other.doc_postings.items():
-            for start, importance in postings.positions:
-                self.add_posting(doc_id, start, importance)
+        # merge postings from another IndexEntry; partials cover disjoint doc batches,
+        # so the common case is adopting the other posting wholesale
+        for doc_id, posting in other.doc_postings.items():
+            existing_posting = self.doc_postings.get(doc_id)
+            if existing_posting is None:
+                self.doc_postings[doc_id] = posting
+            else:
+                existing_posting.add_positions(posting)
 
     def get_tf(self, doc_id: int) -> float:
         posting = self.get_posting(doc_id)
@@ -103,19 +187,21 @@ class IndexEntry:
             tf += 1 + importance * 0.5
         return tf
 
-    def calculate_log_tf(self, doc_id: int) -> None:
+    def calculate_log_tf(self, doc_id: int) -> float:
         tf = self.get_tf(doc_id)
         self.doc_postings[doc_id].log_tf = 1 + math.log10(tf) if tf else 0
+        return tf
 
     def calculate_idf(self, num_docs) -> None:
-        unique_doc_ids = set(self.doc_postings.keys())
-        self.idf = math.log10(num_docs / len(unique_doc_ids)) if unique_doc_ids else 0 / 0
+        # doc_postings is keyed by doc_id, so its length is the document frequency
+        self.idf = math.log10(num_docs / len(self.doc_postings)) if self.doc_postings else 0 / 0
 
 
 class Index:
     # inverted index: token (str) -> IndexEntry (list of Postings)
     def __init__(self):
         self.token_to_entry: dict[str, IndexEntry] = {}
+        self.total_postings = 0  # running (token, doc) pair count; O(1) for progress reporting
 
     def __len__(self) -> int:
         return len(self.token_to_entry)
@@ -147,7 +233,8 @@ class Index:
             entry = IndexEntry(token=token)
             self.add_entry(entry)
             curr_entry = entry
-        curr_entry.add_posting(doc_id, start, importance)
+        if curr_entry.add_posting(doc_id, start, importance):
+            self.total_postings += 1
 
     def merge(self, other: "Index") -> None:
         # merge another index into this one
@@ -156,118 +243,173 @@ class Index:
                 self.token_to_entry[token] = other.token_to_entry[token]
             else:
                 self.token_to_entry[token].merge(other.token_to_entry[token])
+        self.total_postings = sum(len(entry.doc_postings) for entry in self.token_to_entry.values())
 
     def write_to_disk(self, path: str) -> None:
         os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
         sorted_entries = sorted(self.token_to_entry.values(), key=lambda x: x.token)
-        with open(path, "w", encoding="utf-8") as f:
-            f.writelines(
-                json.dumps(entry.to_dict(), separators=(",", ":"), ensure_ascii=False) + "\n"
-                for entry in sorted_entries
-            )
-
-
-@dataclass(order=False)
-class HeapEntry:
-    token: str
-    entry: IndexEntry
-    file: TextIO
-
-    def __lt__(self, other):
-        return self.token < other.token
-
-    def __le__(self, other):
-        return self.token <= other.token
+        with open(path, "wb") as f:
+            for entry in sorted_entries:
+                _write_partial_record(f, entry)
+
+
+def _write_partial_record(f, entry: IndexEntry) -> None:
+    # binary partial record: token_nbytes:varint | token utf-8 | IndexEntry record (see to_bytes)
+    token_bytes = entry.token.encode("utf-8")
+    header = bytearray()
+    encode_varint(len(token_bytes), header)
+    f.write(bytes(header) + token_bytes + entry.to_bytes())
+
+
+class PartialReader:
+    # sequential reader over one binary partial index file; mmap lets the page
+    # cache back the buffer instead of copying whole partials into the heap
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+        self.pos = 0
+
+    def next_entry(self) -> IndexEntry | None:
+        if self.pos >= len(self.buf):
+            return None
+        token_len, pos = decode_varint(self.buf, self.pos)
+        token = self.buf[pos : pos + token_len].decode("utf-8")
+        entry, self.pos = IndexEntry.decode(self.buf, pos + token_len, token=token)
+        return entry
 
-    def __eq__(self, other):
-        return self.token == other.token
 
-    def __hash__(self):
-        return hash(self.token)
+_EXHAUSTED = "\U0010ffff"  # sorts after every real token
+
+
+class _LoserTree:
+    # tournament tree over the partial readers: advancing a leaf replays one
+    # root-to-leaf path (log2 k token compares) vs ~2 log2 k for a binary heap,
+    # with no per-record wrapper objects
+    def __init__(self, readers: list[PartialReader]):
+        self._readers = readers
+        self._k = k = len(readers)
+        self._entries: list[IndexEntry | None] = []
+        self._tokens: list[str] = []
+        for reader in readers:
+            entry = reader.next_entry()
+            self._entries.append(entry)
+            self._tokens.append(entry.token if entry else _EXHAUSTED)
+        self._tree = [-1] * k  # internal nodes hold loser leaf indices; [0] is the winner
+        for leaf in range(k - 1, -1, -1):
+            self._play_up(leaf, building=True)
+
+    def _play_up(self, leaf: int, building: bool = False) -> None:
+        tokens, tree = self._tokens, self._tree
+        winner = leaf
+        node = (leaf + self._k) >> 1
+        while node:
+            loser = tree[node]
+            if building and loser == -1:
+                tree[node] = winner
+                return
+            if tokens[loser] < tokens[winner]:
+                tree[node] = winner
+                winner = loser
+            node >>= 1
+        tree[0] = winner
+
+    def peek_token(self) -> str:
+        return self._tokens[self._tree[0]]
+
+    def pop(self) -> IndexEntry | None:
+        # hand out the winning entry, refill its leaf and replay that path
+        leaf = self._tree[0]
+        entry = self._entries[leaf]
+        if entry is None:
+            return None
+        next_entry = self._readers[leaf].next_entry()
+        self._entries[leaf] = next_entry
+        self._tokens[leaf] = next_entry.token if next_entry else _EXHAUSTED
+        self._play_up(leaf)
+        return entry
 
 
 def read_partial_index(path: str) -> Index:
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    reader = PartialReader(path)
     index = Index()
-    for d in data["entries"]:
-        entry = IndexEntry.from_dict(d)
+    while (entry := reader.next_entry()) is not None:
         index.token_to_entry[entry.token] = entry
     return index
 
 
-def _push_entry_to_heap(heap: list[HeapEntry], file: TextIO):
-    line = file.readline()
-    if line:
-        entry = IndexEntry.from_dict(json.loads(line))
-        heapq.heappush(heap, HeapEntry(entry.token, entry, file))
+def merge_partials(partial_paths: list[str], out_path: str) -> None:
+    # combine sorted partials into one larger sorted partial; idf/log_tf are
+    # still unset here, those are computed in the final merge
+    readers = [PartialReader(path) for path in partial_paths]
+    tree = _LoserTree(readers)
+    with open(out_path, "wb") as f:
+        while (entry := tree.pop()) is not None:
+            while tree.peek_token() == entry.token:
+                entry.merge(tree.pop())
+            _write_partial_record(f, entry)
 
 
 def merge_partial_indexes(partial_paths: list[str], num_docs: int) -> None:
-    with ExitStack() as stack:
-        # Open all partial index files at once
-        files = [stack.enter_context(open(path, "r", encoding="utf-8")) for path in partial_paths]
-
-        heap = []
-        offsets = {}
-        doc_norms: dict[int, float] = defaultdict(float)
-
-        # Seed heap with first lines from each file
-        for file in files:
-            _push_entry_to_heap(heap, file)
-
-        with open(FINAL_INDEX_PATH, "w", encoding="utf-8") as out_file:
-            while heap:
-                # fetch top element and push the next entry from the same file
-                heap_entry = heapq.heappop(heap)
-                token, entry, file = heap_entry.token, heap_entry.entry, heap_entry.file
-                _push_entry_to_heap(heap, file)
-
-                # fetch and merge all the elements in heap that match the token popped initially
-                # - Every time we pop, we push the next entry in that file to the heap to keep growing the heap
-                while heap and heap[0].token == token:
-                    next_heap_entry = heapq.heappop(heap)
-                    next_entry, same_file = next_heap_entry.entry, next_heap_entry.file
-                    entry.merge(next_entry)
-                    _push_entry_to_heap(heap, same_file)
-
-                entry.calculate_idf(num_docs)
-                for doc_id in entry.doc_postings:
-                    entry.calculate_log_tf(doc_id)
-                    doc_norms[doc_id] += entry.doc_postings[doc_id].log_tf ** 2
-                offsets[token] = (out_file.tell(), round(entry.idf, 4))
-                d = entry.to_dict()
-                del d["token"]  # token is redundant since it's the key in the index
-                out_file.write(json.dumps(d, separators=(",", ":"), ensure_ascii=False) + "\n")
-
-        with open(TOKEN_INFO_PATH, "w", encoding="utf-8") as f:
-            json.dump(offsets, f, ensure_ascii=False)
-        with open(DOC_NORM_PATH, "w", encoding="utf-8") as f:
-            doc_norms = {doc_id: math.sqrt(norm) for doc_id, norm in doc_norms.items()}
-            json.dump(doc_norms, f, ensure_ascii=False)
+    readers = [PartialReader(path) for path in partial_paths]
+    tree = _LoserTree(readers) if readers else None
+
+    offsets = {}
+    doc_norms: dict[int, float] = defaultdict(float)
+    doc_lengths: dict[int, float] = defaultdict(float)  # importance-weighted doc lengths for BM25
+
+    with open(FINAL_INDEX_PATH, "wb") as out_file:
+        while tree and (entry := tree.pop()) is not None:
+            token = entry.token
+            # merge every same-token entry from the other partials before emitting
+            while tree.peek_token() == token:
+                entry.merge(tree.pop())
+
+            entry.calculate_idf(num_docs)
+            for doc_id in entry.doc_postings:
+                tf = entry.calculate_log_tf(doc_id)
+                doc_norms[doc_id] += entry.doc_postings[doc_id].log_tf ** 2
+                if " " not in token:  # bigrams would double-count length
+                    doc_lengths[doc_id] += tf
+            offsets[token] = (out_file.tell(), round(entry.idf, 4))
+            out_file.write(entry.to_bytes())  # token is redundant since it's the key in the offset table
+
+    with open(TOKEN_INFO_PATH, "wb") as f:
+        f.write(orjson.dumps(offsets))
+    with open(DOC_NORM_PATH, "wb") as f:
+        doc_norms = {doc_id: math.sqrt(norm) for doc_id, norm in doc_norms.items()}
+        f.write(orjson.dumps(doc_norms, option=orjson.OPT_NON_STR_KEYS))
+    with open(DOC_LENGTH_PATH, "wb") as f:
+        f.write(orjson.dumps({doc_id: round(length, 2) for doc_id, length in doc_lengths.items()}, option=orjson.OPT_NON_STR_KEYS))
 
 
 def build_token_info() -> dict[str, tuple[int, float]]:
     print("Loading token info...")
-    with open(TOKEN_INFO_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    with open(TOKEN_INFO_PATH, "rb") as f:
+        data = orjson.loads(f.read())
     print("Token info loaded.\n")
     return {token: (v[0], v[1]) for token, v in data.items()}
 
 
 def build_norms() -> dict[int, float]:
     print("Loading document norms...")
-    with open(DOC_NORM_PATH, "r", encoding="utf-8") as norm_file:
-        data = json.load(norm_file)
+    with open(DOC_NORM_PATH, "rb") as norm_file:
+        data = orjson.loads(norm_file.read())
     print("Document norms loaded.\n")
     return {int(k): v for k, v in data.items()}
 
 
-def fetch_from_index(token, query_mode, token_info: dict[str, tuple[int, float]], file) -> IndexEntry:
+def build_doc_lengths() -> dict[int, float]:
+    try:
+        with open(DOC_LENGTH_PATH, "rb") as f:
+            data = orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}  # index predates BM25; callers fall back to the average length
+    return {int(k): v for k, v in data.items()}
+
+
+def fetch_from_index(token, query_mode, token_info: dict[str, tuple[int, float]], buf) -> IndexEntry:
+    # buf is the mmap'd final index; records are self-delimiting so the offset is enough
     offset = token_info[token][0] if token in token_info else None
     if offset is None:
         return IndexEntry(token)
-    file.seek(offset)
-    entry = IndexEntry.from_dict(json.loads(file.readline()), with_token=False, query_mode=query_mode)
-    entry.token = token
-    return entry
+    return IndexEntry.from_bytes(buf, offset, token=token, query_mode=query_mode)
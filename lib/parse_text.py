@@ -1,57 +1,92 @@
-import bisect
-import warnings
+import sys
 from collections import defaultdict
+from functools import lru_cache
+from itertools import pairwise
 
-from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
+from lxml import etree
 from nltk import bigrams
 from nltk.stem import PorterStemmer
 from nltk.tokenize import WordPunctTokenizer
 
 from lib.index import Importance
 
-# suppress BeautifulSoup XML and URL warnings
-warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
-warnings.filterwarnings("ignore", category=UserWarning, module="bs4")
+_html_parser = etree.HTMLParser(recover=True)
+_important_tags = {"h1", "h2", "h3", "b", "strong", "title"}
 
 _tokenizer = WordPunctTokenizer()
 _stemmer = PorterStemmer()
-_stem_cache = {}  # cache for stemmed tokens to avoid redundant stemming
 
 
-def extract_text(html_text: str) -> tuple[str, list[tuple[int, int, Importance]]]:
-    # extract plain text from HTML; return (body text, important text from title/headings/bold)
-    if not html_text:
-        return "", []
+@lru_cache(maxsize=200_000)
+def _stem(token: str) -> str:
+    # token frequencies are Zipfian, so most stems come straight from the cache;
+    # interning means repeat stems share one string whose hash is computed once
+    return sys.intern(_stemmer.stem(token))
 
-    soup = BeautifulSoup(html_text, "lxml")
-    important_tags = {"h1", "h2", "h3", "b", "strong", "title"}
 
-    text_chunks = []
-    spans = []
-    offset = 0
+def _iter_chunks(html_text: str):
+    # yield (text chunk, importance) pairs in document order
+    if not html_text:
+        return
+
+    # crawls contain plenty of plain-text/JSON responses; skip the HTML parse
+    # when there's no tag in sight
+    if "<" not in html_text[:256]:
+        text = html_text.strip()
+        if text:
+            yield text, Importance.NORMAL
+        return
+
+    try:
+        root = etree.fromstring(html_text.encode("utf-8", errors="ignore"), _html_parser)
+    except etree.XMLSyntaxError:
+        root = None
+    if root is None:
+        return
+
+    # single lxml walk; the stack tracks the nearest important ancestor instead
+    # of re-walking parents per text node
+    importance_stack = [Importance.NORMAL]
+    for event, node in etree.iterwalk(root, events=("start", "end")):
+        if event == "start":
+            tag = node.tag
+            if not isinstance(tag, str):  # comment / processing instruction
+                importance_stack.append(importance_stack[-1])
+                continue
+            if tag in _important_tags:
+                importance = Importance.TITLE if tag == "title" else Importance.BOLD_OR_HEADING
+            else:
+                importance = importance_stack[-1]
+            importance_stack.append(importance)
+            if node.text and (text := node.text.strip()):
+                yield text, importance
+        else:
+            importance_stack.pop()
+            if node.tail and (text := node.tail.strip()):
+                yield text, importance_stack[-1]
 
-    # iterate through all string elements
-    for element in soup.find_all(string=True):
-        text = element.strip()
-        if not text:
-            continue
 
-        # relate this element to its nearest higher importance
-        importance = Importance.NORMAL
-        for parent in element.parents:
-            if parent.name in important_tags:
-                importance = Importance.TITLE if parent.name == "title" else Importance.BOLD_OR_HEADING
-                break
+def extract_tokens(html_text: str) -> dict[str, list[tuple[int, Importance]]]:
+    # fused HTML walk + tokenize + importance: each chunk goes straight through
+    # the tokenizer with its importance attached, instead of joining a full_text
+    # string and re-deriving importance per position afterwards
+    token_positions: defaultdict[str, list[tuple[int, Importance]]] = defaultdict(list)
+    stemmed_list: list[tuple[str, int, Importance]] = []
+    token_idx = 0
+
+    for chunk, importance in _iter_chunks(html_text):
+        for token in _tokenizer.tokenize(chunk.lower()):
+            if not token or not token.isalnum() or not token.isascii():
+                continue
+            stemmed = _stem(token)
+            token_positions[stemmed].append((token_idx, importance))
+            stemmed_list.append((stemmed, token_idx, importance))
+            token_idx += 1
 
-        # adjust offset and store start and end of chunk so importance can be assigned to individual tokens
-        start = offset
-        end = offset + len(text)
-        spans.append((start, end, importance))
-        text_chunks.append(text)
-        offset = end + 1
-    # reconstruct full text
-    full_text = " ".join(text_chunks)
-    return full_text, spans
+    # bigrams span chunk boundaries, keyed by the first token's position/importance
+    for (first, pos, importance), (second, _, _) in pairwise(stemmed_list):
+        token_positions[first + " " + second].append((pos, importance))
+    return token_positions
 
 
 def tokenize(text: str) -> dict[str, list[int]]:
@@ -66,9 +101,7 @@ def tokenize(text: str) -> dict[str, list[int]]:
     for token in _tokenizer.tokenize(text.lower()):
         if not token or not token.isalnum() or not token.isascii():
             continue
-        if token not in _stem_cache:
-            _stem_cache[token] = _stemmer.stem(token)
-        stemmed = _stem_cache[token]
+        stemmed = _stem(token)
         starts[stemmed].append(token_idx)
         stemmed_list.append((stemmed, token_idx))
         token_idx += 1
@@ -78,24 +111,3 @@ def tokenize(text: str) -> dict[str, list[int]]:
         bi_string = " ".join([t[0] for t in bigram])
         starts[bi_string].append(bigram[0][1])  # position of first token in bigram
     return starts
-
-
-def assign_importance(
-    starts: dict[str, list[int]], spans: list[tuple[int, int, Importance]]
-) -> dict[str, list[tuple[int, Importance]]]:
-    # get where each chunk in spans starts
-    span_starts = [span[0] for span in spans]
-    pos_importance = {}  # position -> importance for quick lookup
-    all_starts = set()
-    for positions in starts.values():
-        all_starts.update(positions)
-
-    for pos in all_starts:
-        idx = bisect.bisect_right(span_starts, pos) - 1
-        if idx >= 0:
-            start, end, importance = spans[idx]
-            pos_importance[pos] = importance if start <= pos <= end else Importance.NORMAL
-        else:
-            pos_importance[pos] = Importance.NORMAL
-
-    return {token: [(pos, pos_importance[pos]) for pos in positions] for token, positions in starts.items()}
@@ -0,0 +1,28 @@
+import sys
+
+import numpy as np
+
+from lib.doc_loading import all_jsons_iter, packed_corpus_paths
+from lib.globals import DATASET_DIR
+
+
+# concatenate every per-document json into one blob with a uint64 offset table,
+# so index builds read the corpus through a single mmap instead of thousands of small files
+def pack_corpus(dataset_dir: str = DATASET_DIR) -> None:
+    bin_path, idx_path = packed_corpus_paths(dataset_dir)
+    offsets = [0]
+    file_count = 0
+    with open(bin_path, "wb") as out:
+        for path in all_jsons_iter(dataset_dir):
+            with open(path, "rb") as f:
+                out.write(f.read())
+            offsets.append(out.tell())
+            file_count += 1
+            if file_count % 10000 == 0:
+                print(f"\tPacked {file_count} files...")
+    np.asarray(offsets, dtype=np.uint64).tofile(idx_path)
+    print(f"Packed {file_count} files into {bin_path} ({offsets[-1] / 1024 / 1024:.1f} MB), offsets in {idx_path}")
+
+
+if __name__ == "__main__":
+    pack_corpus(sys.argv[1] if len(sys.argv) > 1 else DATASET_DIR)
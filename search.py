@@ -1,22 +1,28 @@
 import heapq
 import math
+import mmap
 import sys
 import time
 from collections import defaultdict
 from functools import lru_cache
 
+import numpy as np
+
 from lib.common import read_doc_mapping, read_pagerank
-from lib.globals import FINAL_INDEX_PATH, MIN_IDF, PROXIMITY_WEIGHT, RETURN_SIZE
-from lib.index import IndexEntry, build_norms, build_token_info, fetch_from_index
+from lib.globals import BM25_B, BM25_K1, ENTRY_CACHE_SIZE, FINAL_INDEX_PATH, MIN_IDF, PROXIMITY_WEIGHT, RETURN_SIZE
+from lib.index import IndexEntry, build_doc_lengths, build_token_info, fetch_from_index
 from lib.parse_text import tokenize
 
 TOKEN_INFO = build_token_info()
 DOC_MAPPING = read_doc_mapping()
 NUM_DOCS = len(DOC_MAPPING)
-DOC_NORMS = build_norms()
+DOC_LENGTHS = build_doc_lengths()
+AVG_DOC_LEN = (sum(DOC_LENGTHS.values()) / len(DOC_LENGTHS)) if DOC_LENGTHS else 1.0
 PAGERANK_SCORES = read_pagerank()
 PAGERANK_SCALE = max(PAGERANK_SCORES.values()) if PAGERANK_SCORES else 1.0
-INDEX_FILE = open(FINAL_INDEX_PATH, "r", encoding="utf-8")  # noqa: SIM115
+INDEX_FILE = open(FINAL_INDEX_PATH, "rb")  # noqa: SIM115
+# mmap the final index so lookups are zero-copy reads out of the page cache instead of buffered file I/O
+INDEX_MMAP = mmap.mmap(INDEX_FILE.fileno(), 0, access=mmap.ACCESS_READ)
 
 
 def query_parser(query: str) -> list[tuple[int, float]]:
@@ -30,27 +36,33 @@ def query_parser(query: str) -> list[tuple[int, float]]:
 
     if len(results) < RETURN_SIZE:
         # get entries for query tokens and doc_id: # of query tokens in doc
-        entries, doc_token_counts, query_entry_weights, query_norm = _fetch_entries_and_generate_weights(token_counts)
+        entries, doc_token_counts, query_entry_weights = _fetch_entries_and_generate_weights(token_counts)
         query_len = sum(1 for t in entries if " " not in t)
-        valid_doc_counts = {
-            i: {doc_id for doc_id, count in doc_token_counts.items() if count >= i} for i in range(1, query_len + 1)
-        }
+        # bucket docs by how many query tokens they contain (single pass instead of one scan per threshold)
+        count_buckets: dict[int, set[int]] = defaultdict(set)
+        for doc_id, count in doc_token_counts.items():
+            count_buckets[min(count, query_len)].add(doc_id)
 
         # Iterate in reverse from query_len to 1, getting docs with at least that many query tokens and adding to results until we have enough results
         min_tokens_in_doc = max(1, query_len - 1)
+        valid_doc_ids: set[int] = set()
+        for i in range(min_tokens_in_doc, query_len + 1):
+            valid_doc_ids |= count_buckets[i]
         while len(results) < RETURN_SIZE and min_tokens_in_doc > 0:
-            valid_doc_ids = valid_doc_counts.get(min_tokens_in_doc, set())
-            for doc_id, score in vector_search(query_entry_weights, query_norm, entries, valid_doc_ids):
+            for doc_id, score in vector_search(query_entry_weights, entries, valid_doc_ids):
                 if doc_id not in results or score > results[doc_id]:
                     results[doc_id] = score
             min_tokens_in_doc -= 1
+            valid_doc_ids |= count_buckets[min_tokens_in_doc]
 
     # Combine text relevance with PageRank, giving 0.15 weight to PageRank
-    if len(PAGERANK_SCORES) > 0:
+    # (BM25 scores are unbounded, so scale relevance by the best score in this result set first)
+    if len(PAGERANK_SCORES) > 0 and results:
+        rel_scale = max(results.values()) or 1.0
         combined = {}
         for doc_id, rel_score in results.items():
             norm_pr = PAGERANK_SCORES.get(doc_id, 0) / PAGERANK_SCALE
-            combined[doc_id] = 0.85 * rel_score + 0.15 * norm_pr
+            combined[doc_id] = 0.85 * rel_score / rel_scale + 0.15 * norm_pr
         results = combined
 
     return heapq.nlargest(RETURN_SIZE, results.items(), key=lambda x: x[1])
@@ -83,31 +95,56 @@ def proximity_score(entries: dict[str, IndexEntry], doc_id: int) -> float:
     return coverage * window_score
 
 
+_BM25_CACHE: dict[str, tuple[np.ndarray, np.ndarray]] = {}  # token -> (doc_ids, saturation); query-independent
+
+
+def _bm25_doc_weights(token: str, entry: IndexEntry) -> tuple[np.ndarray, np.ndarray]:
+    # BM25 tf-saturation depends only on the document, so compute it once per entry and reuse across queries
+    arrays = _BM25_CACHE.get(token)
+    if arrays is None:
+        doc_ids, _, tfs = entry.score_arrays()
+        lengths = np.fromiter(
+            (DOC_LENGTHS.get(doc_id, AVG_DOC_LEN) for doc_id in doc_ids.tolist()), dtype=np.float64, count=len(doc_ids)
+        )
+        length_norms = 1 - BM25_B + BM25_B * lengths / AVG_DOC_LEN
+        saturation = tfs * (BM25_K1 + 1) / (tfs + BM25_K1 * length_norms)
+        _BM25_CACHE[token] = arrays = (doc_ids, saturation)
+    return arrays
+
+
 def exact_search(exact_string: str) -> list[tuple[int, float]]:
     entry = _fetch_from_entry_cached(exact_string)
     if not entry or not entry.doc_postings:
         return []
-    return [(doc_id, posting.log_tf / DOC_NORMS.get(doc_id, 1)) for doc_id, posting in entry.doc_postings.items()]
+    doc_ids, saturation = _bm25_doc_weights(exact_string, entry)
+    return list(zip(doc_ids.tolist(), (entry.idf * saturation).tolist()))
 
 
 def vector_search(
-    query_entry_weights: dict[str, float], query_norm: float, entries: dict[str, IndexEntry], valid_doc_ids: set[int]
+    query_entry_weights: dict[str, float], entries: dict[str, IndexEntry], valid_doc_ids: set[int]
 ) -> list[tuple[int, float]]:
-    scores: dict[int, float] = defaultdict(float)
+    if not valid_doc_ids:
+        return []
+    # accumulate BM25 contributions over candidate docs in numpy instead of per-posting Python loops
+    candidates = np.fromiter(valid_doc_ids, dtype=np.int64, count=len(valid_doc_ids))
+    candidates.sort()
+    scores = np.zeros(len(candidates), dtype=np.float64)
     for token, entry in entries.items():
-        for doc_id, posting in entry.doc_postings.items():
-            if doc_id in valid_doc_ids:
-                scores[doc_id] += posting.log_tf * query_entry_weights[token]
-    for doc_id in scores:
-        doc_norm = DOC_NORMS.get(doc_id, 1)
-        scores[doc_id] /= (query_norm * doc_norm) or 1.0
-        scores[doc_id] *= 1 + PROXIMITY_WEIGHT * proximity_score(entries, doc_id)
-    return list(scores.items())
+        doc_ids, saturation = _bm25_doc_weights(token, entry)
+        idx = np.searchsorted(doc_ids, candidates)
+        idx[idx == len(doc_ids)] = 0  # clamp overshoots; the equality mask below rejects them
+        matched = doc_ids[idx] == candidates
+        scores[matched] += saturation[idx[matched]] * query_entry_weights[token]
+    results = []
+    for doc_id, score in zip(candidates.tolist(), scores.tolist()):
+        if score:
+            results.append((doc_id, score * (1 + PROXIMITY_WEIGHT * proximity_score(entries, doc_id))))
+    return results
 
 
-@lru_cache(maxsize=1024)
+@lru_cache(maxsize=ENTRY_CACHE_SIZE)
 def _fetch_from_entry_cached(token, query_mode=False) -> IndexEntry:
-    entry = fetch_from_index(token, query_mode, TOKEN_INFO, INDEX_FILE)
+    entry = fetch_from_index(token, query_mode, TOKEN_INFO, INDEX_MMAP)
     if entry and entry.doc_postings:
         return entry
     return IndexEntry(token)  # return empty entry for tokens not found or with no postings to avoid repeated lookups
@@ -115,11 +152,10 @@ def _fetch_from_entry_cached(token, query_mode=False) -> IndexEntry:
 
 def _fetch_entries_and_generate_weights(
     tokens: dict[str, int],
-) -> tuple[dict[str, IndexEntry], dict[int, int], dict[str, float], float]:
+) -> tuple[dict[str, IndexEntry], dict[int, int], dict[str, float]]:
     entries = {}
     doc_token_counts: dict[int, int] = defaultdict(int)
     query_entry_weights: dict[str, float] = defaultdict(float)
-    query_norm = 0.0
     for token, count in tokens.items():
         if token in TOKEN_INFO and TOKEN_INFO[token][1] < MIN_IDF:
             continue
@@ -132,10 +168,8 @@ def _fetch_entries_and_generate_weights(
                 doc_token_counts[doc_id] += 1
         weight = (1 + math.log10(count)) * entry.idf if count else 0
         query_entry_weights[token] = weight
-        query_norm += weight**2
 
-    query_norm = math.sqrt(query_norm)
-    return entries, doc_token_counts, query_entry_weights, query_norm
+    return entries, doc_token_counts, query_entry_weights
 
 
 def _bigram_search(bigram_tokens: list[str]) -> dict[int, float]:
@@ -162,6 +196,7 @@ def main(args: list[str]) -> None:
         print(f"{output_num}. URL: {DOC_MAPPING.get(doc_id, 'Unknown')}, Score: {abs(score):.4f}")
         output_num += 1
     print(f"Search completed in {elapsed * 1000:.2f}ms")
+    INDEX_MMAP.close()
     INDEX_FILE.close()
 
 